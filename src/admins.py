@@ -0,0 +1,45 @@
+from telegram import Update
+from telegram.ext import ContextTypes, ChatMemberHandler
+from cache import LRUCache
+from cluster import cluster
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд доверяем закэшированному списку администраторов
+ADMINS_TTL = 600
+
+ADMIN_STATUSES = ['creator', 'administrator']
+
+# chat_id -> (множество user_id администраторов, время загрузки)
+_admins = LRUCache(maxsize=1000)
+
+async def is_chat_admin(bot, chat_id, user_id):
+    """Проверить права администратора по кэшу списка админов чата"""
+    entry = _admins.get(chat_id)
+    if entry is None or time.monotonic() - entry[1] > ADMINS_TTL:
+        # В личных чатах и при ошибках API администраторов нет
+        try:
+            administrators = await bot.get_chat_administrators(chat_id)
+        except Exception as e:
+            logger.warning(f"Could not get administrators of chat {chat_id}: {e}")
+            return False
+        entry = ({member.user.id for member in administrators}, time.monotonic())
+        _admins.set(chat_id, entry)
+    return user_id in entry[0]
+
+def invalidate_admins(chat_id):
+    _admins.pop(chat_id)
+
+async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сбросить кэш админов, когда кого-то назначили или сняли"""
+    change = update.chat_member
+    if change.old_chat_member.status in ADMIN_STATUSES or change.new_chat_member.status in ADMIN_STATUSES:
+        invalidate_admins(change.chat.id)
+        cluster.publish('admins', chat_id=change.chat.id)
+
+cluster.on('admins', lambda payload: invalidate_admins(payload['chat_id']))
+
+def add_admin_handlers(application):
+    application.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
@@ -0,0 +1,201 @@
+from collections import Counter, deque
+from datetime import datetime, timezone
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, TypeHandler, ApplicationHandlerStop, BaseUpdateProcessor
+from admins import is_chat_admin
+from antiflood import admit_message
+from usernames import observe_user
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: чем меньше, тем важнее
+PRIORITY_INTERACTIVE = 0  # кнопки и команды
+PRIORITY_REACTION = 1     # реакции
+PRIORITY_ARCHIVAL = 2     # архивация обычных сообщений
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_REACTION: 'reaction',
+    PRIORITY_ARCHIVAL: 'archival'
+}
+
+# Задержка очереди (секунды), после которой архивация идет выборочно
+ARCHIVAL_SHED_LATENCY = 5
+# Задержка, после которой реакции откладываются до разгрузки
+REACTION_DEFER_LATENCY = 15
+# При перегрузке архивируется каждое N-е сообщение
+ARCHIVAL_SAMPLE_RATE = 10
+# Сколько отложенных реакций храним и возвращаем в очередь за раз
+MAX_DEFERRED = 5000
+DRAIN_BATCH = 200
+DRAIN_INTERVAL = 5
+# Сколько обновлений обрабатывается одновременно: команды и кнопки не ждут
+# очереди архивации и реакций, у тех свой небольшой лимит
+INTERACTIVE_CONCURRENCY = 16
+BACKGROUND_CONCURRENCY = 4
+
+def classify(update: Update):
+    """Определить класс приоритета обновления"""
+    if update.callback_query:
+        return PRIORITY_INTERACTIVE
+    if update.message_reaction or update.message_reaction_count:
+        return PRIORITY_REACTION
+
+    message = update.message or update.edited_message
+    if message is None:
+        return PRIORITY_INTERACTIVE
+    if message.text and message.text.startswith('/'):
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_ARCHIVAL
+
+def _update_date(update: Update):
+    if update.message_reaction:
+        return update.message_reaction.date
+    message = update.message or update.edited_message
+    if message:
+        return message.edit_date or message.date
+    return None
+
+class AdmissionController:
+    """Оценивает задержку очереди и решает, что обработать, отложить или пропустить"""
+
+    def __init__(self):
+        self.latency = 0.0  # сглаженная задержка обновлений, секунды
+        self.counters = Counter()  # (класс, решение) -> количество
+        self._last_sample = time.monotonic()
+        self._archival_seen = 0
+        self._deferred = deque()
+        self._replayed = set()
+
+    def observe(self, update: Update):
+        date = _update_date(update)
+        if date is None:
+            return
+        sample = max(0.0, (datetime.now(timezone.utc) - date).total_seconds())
+        self.latency = 0.8 * self.latency + 0.2 * sample
+        self._last_sample = time.monotonic()
+
+    def admit(self, update: Update):
+        """Вернуть 'run', 'defer' или 'shed'"""
+        priority = classify(update)
+
+        # Отложенные обновления, возвращенные в очередь, пропускаем без оценки
+        if update.update_id in self._replayed:
+            self._replayed.discard(update.update_id)
+            return self._count(priority, 'run')
+
+        self.observe(update)
+
+        if priority == PRIORITY_REACTION and self.latency > REACTION_DEFER_LATENCY:
+            if len(self._deferred) >= MAX_DEFERRED:
+                return self._count(priority, 'shed')
+            self._deferred.append(update)
+            return self._count(priority, 'defer')
+
+        if priority == PRIORITY_ARCHIVAL and self.latency > ARCHIVAL_SHED_LATENCY:
+            self._archival_seen += 1
+            if self._archival_seen % ARCHIVAL_SAMPLE_RATE:
+                return self._count(priority, 'shed')
+
+        return self._count(priority, 'run')
+
+    def _count(self, priority, decision):
+        self.counters[(PRIORITY_NAMES[priority], decision)] += 1
+        return decision
+
+    def drain(self):
+        """Забрать отложенные обновления, если нагрузка спала"""
+        # Без новых обновлений задержку оценить не по чему - постепенно ее сбрасываем
+        if time.monotonic() - self._last_sample > DRAIN_INTERVAL:
+            self.latency /= 2
+
+        if self.latency > ARCHIVAL_SHED_LATENCY:
+            return []
+
+        batch = []
+        while self._deferred and len(batch) < DRAIN_BATCH:
+            update = self._deferred.popleft()
+            self._replayed.add(update.update_id)
+            batch.append(update)
+        return batch
+
+    @property
+    def deferred(self):
+        return len(self._deferred)
+
+# Состояние в памяти процесса: при MULTI_INSTANCE у каждого экземпляра свое (см. README)
+admission = AdmissionController()
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений с отдельными лимитами по классам приоритета.
+
+    Команды и кнопки запускаются сразу и не стоят за накопившейся
+    архивацией; архивация и реакции делят BACKGROUND_CONCURRENCY мест.
+    """
+
+    def __init__(self):
+        super().__init__(max_concurrent_updates=INTERACTIVE_CONCURRENCY + BACKGROUND_CONCURRENCY)
+        self._interactive = asyncio.BoundedSemaphore(INTERACTIVE_CONCURRENCY)
+        self._background = asyncio.BoundedSemaphore(BACKGROUND_CONCURRENCY)
+
+    async def process_update(self, update, coroutine):
+        # Общий семафор базового класса не используем: фоновые обновления,
+        # ждущие своей очереди, не должны занимать места интерактивных
+        if isinstance(update, Update) and classify(update) == PRIORITY_INTERACTIVE:
+            semaphore = self._interactive
+        else:
+            semaphore = self._background
+        async with semaphore:
+            await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def admission_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Первый обработчик: при перегрузке отсекает низкоприоритетные обновления"""
+    decision = admission.admit(update)
+    if decision == 'run':
+        return
+
+    # Пропускаем только запись в архив: проверки в памяти должны видеть каждое
+    # сообщение, иначе во время всплеска антифлуд заметит лишь каждое N-е
+    if decision == 'shed' and update.message:
+        observe_user(update.message.chat.id, update.message.from_user)
+        await admit_message(update.message, context)
+    raise ApplicationHandlerStop
+
+async def drain_deferred(context: ContextTypes.DEFAULT_TYPE):
+    """Вернуть отложенные реакции в очередь обновлений"""
+    for update in admission.drain():
+        await context.application.update_queue.put(update)
+
+async def show_load(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /load: задержка очереди и счетчики пропущенных обновлений"""
+    if not await is_chat_admin(context.bot, update.effective_chat.id, update.effective_user.id):
+        await update.message.reply_text("❌ Эта команда только для администраторов!")
+        return
+
+    text = f"⚙️ <b>НАГРУЗКА</b>\n\n⏱️ Задержка очереди: {admission.latency:.1f} с\n"
+    text += f"📥 Отложено реакций: {admission.deferred}\n\n"
+    for name in PRIORITY_NAMES.values():
+        run = admission.counters[(name, 'run')]
+        deferred = admission.counters[(name, 'defer')]
+        shed = admission.counters[(name, 'shed')]
+        text += f"<b>{name}</b>: обработано {run}, отложено {deferred}, пропущено {shed}\n"
+
+    await update.message.reply_text(text, parse_mode='HTML')
+
+def add_admission_handlers(application):
+    """Подключить контроль нагрузки (раньше всех остальных обработчиков)"""
+    application.add_handler(TypeHandler(Update, admission_gate), group=-1)
+    application.add_handler(CommandHandler("load", show_load))
+    application.job_queue.run_repeating(drain_deferred, interval=DRAIN_INTERVAL, first=DRAIN_INTERVAL)
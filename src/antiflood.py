@@ -0,0 +1,134 @@
+from array import array
+from collections import deque
+from telegram import Message
+from telegram.ext import ContextTypes
+from cache import LRUCache
+from database import Database
+import heapq
+import logging
+import re
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Флуд: FLOOD_MAX_MESSAGES сообщений за окно (срабатывает уже на восьмом);
+# альбом считается одним сообщением
+FLOOD_MAX_MESSAGES = 8
+FLOOD_WINDOW_SECONDS = 10
+# Сколько почти одинаковых сообщений среди последних считается спамом
+DUPLICATE_HISTORY = 8
+DUPLICATE_THRESHOLD = 4
+# Доля совпавших позиций сигнатуры, с которой сообщения считаются повтором
+DUPLICATE_MIN_SIMILARITY = 0.5
+# Короткие ответы ("да", "+1") на повторы не проверяем
+DUPLICATE_MIN_LENGTH = 20
+# На сколько нарушитель исключается из архива (и как часто создается жалоба)
+THROTTLE_SECONDS = 300
+
+# Bottom-k скетч по символьным 4-граммам: замена слова или приписанный
+# счетчик меняют лишь часть шинглов, и скетч остается близким
+SHINGLE_SIZE = 4
+SIGNATURE_SIZE = 32
+# Шинглуем только начало текста - стоимость проверки не зависит от длины
+MAX_TEXT_LENGTH = 200
+
+_SEPARATOR_RE = re.compile(r'\W+')
+
+def signature(text):
+    """SIGNATURE_SIZE наименьших crc32 от шинглов текста (128 байт)"""
+    text = _SEPARATOR_RE.sub(' ', text.lower()).strip()[:MAX_TEXT_LENGTH]
+    hashes = {zlib.crc32(text[i:i + SHINGLE_SIZE].encode()) for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    return array('I', heapq.nsmallest(SIGNATURE_SIZE, hashes))
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по двум скетчам (0..1)"""
+    first, second = set(first), set(second)
+    union = heapq.nsmallest(SIGNATURE_SIZE, first | second)
+    if not union:
+        return 0.0
+    return sum(1 for h in union if h in first and h in second) / len(union)
+
+class _UserTrack:
+    __slots__ = ('timestamps', 'signatures', 'throttled_until', 'media_group_id')
+
+    def __init__(self):
+        self.timestamps = deque(maxlen=FLOOD_MAX_MESSAGES)
+        self.signatures = deque(maxlen=DUPLICATE_HISTORY)
+        self.throttled_until = 0.0
+        self.media_group_id = None
+
+class FloodDetector:
+    """Скользящее окно сообщений и сигнатуры недавних текстов по каждой паре (chat, user)"""
+
+    def __init__(self, max_tracked=10000):
+        self._tracks = LRUCache(maxsize=max_tracked)
+
+    def check(self, chat_id, user_id, text=None, now=None, media_group_id=None):
+        """Вернуть причину, если сообщение нужно отсечь.
+
+        'flood' и 'duplicate' - нарушение обнаружено этим сообщением,
+        'throttled' - пользователь уже ограничен; None - сообщение в порядке.
+        """
+        now = now if now is not None else time.monotonic()
+        key = (chat_id, user_id)
+        track = self._tracks.get(key)
+        if track is None:
+            track = _UserTrack()
+            self._tracks.set(key, track)
+
+        if now < track.throttled_until:
+            return 'throttled'
+
+        # Элементы альбома приходят отдельными сообщениями, считаем только первый
+        if media_group_id is not None:
+            if media_group_id == track.media_group_id:
+                return None
+            track.media_group_id = media_group_id
+
+        track.timestamps.append(now)
+        if len(track.timestamps) == FLOOD_MAX_MESSAGES and now - track.timestamps[0] < FLOOD_WINDOW_SECONDS:
+            track.throttled_until = now + THROTTLE_SECONDS
+            return 'flood'
+
+        if text and len(text) >= DUPLICATE_MIN_LENGTH:
+            current = signature(text)
+            similar = sum(1 for other in track.signatures if similarity(current, other) >= DUPLICATE_MIN_SIMILARITY)
+            track.signatures.append(current)
+            if similar + 1 >= DUPLICATE_THRESHOLD:
+                track.throttled_until = now + THROTTLE_SECONDS
+                return 'duplicate'
+
+        return None
+
+# Состояние в памяти процесса: при MULTI_INSTANCE у каждого экземпляра свое (см. README)
+flood_detector = FloodDetector()
+
+async def admit_message(message: Message, context: ContextTypes.DEFAULT_TYPE):
+    """Проверить сообщение до архивации; False - не сохранять"""
+    if not message.from_user:
+        return True
+
+    verdict = flood_detector.check(
+        message.chat.id,
+        message.from_user.id,
+        message.text or message.caption,
+        media_group_id=message.media_group_id
+    )
+    if verdict is None:
+        return True
+
+    # Жалоба создается один раз в начале ограничения
+    if verdict != 'throttled':
+        reason = "Флуд" if verdict == 'flood' else "Повторяющиеся сообщения"
+        logger.info(f"{reason}: user {message.from_user.id} in chat {message.chat.id}")
+        Database.save_message_content(message, context)
+        Database.create_report(
+            reporter_id=context.bot.id,
+            reported_user_id=message.from_user.id,
+            message_id=message.message_id,
+            chat_id=message.chat.id,
+            reason=f"{reason} (автоматически)",
+            report_type='spam'
+        )
+    return False
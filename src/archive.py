@@ -0,0 +1,84 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
+from datetime import datetime
+from database import Database
+from admins import is_chat_admin
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Как часто сбрасывать накопленные удаления в базу (секунды)
+TOMBSTONE_FLUSH_INTERVAL = 30
+
+# Накопленные удаления: (chat_id, message_id, reason, deleted_by, deleted_at)
+_pending_tombstones = []
+
+def record_tombstone(chat_id, message_id, reason, deleted_by=None):
+    """Запомнить удаление сообщения, запись в базу произойдет пачкой"""
+    _pending_tombstones.append((chat_id, message_id, reason, deleted_by, datetime.now()))
+
+async def delete_message(bot, chat_id, message_id, reason, deleted_by=None):
+    """Удалить сообщение в чате и записать его удаление в архив"""
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except Exception as e:
+        logger.warning(f"Could not delete message {message_id}: {e}")
+        return False
+
+    record_tombstone(chat_id, message_id, reason, deleted_by)
+    return True
+
+async def flush_tombstones(context: ContextTypes.DEFAULT_TYPE):
+    """Записать накопленные удаления одной транзакцией"""
+    if not _pending_tombstones:
+        return
+
+    batch = _pending_tombstones[:]
+    del _pending_tombstones[:len(batch)]
+
+    try:
+        Database.record_tombstones(batch)
+        logger.info(f"Recorded {len(batch)} deleted messages")
+    except Exception as e:
+        logger.error(f"Error recording deleted messages: {e}")
+        # Вернем пачку в очередь, чтобы попробовать при следующем сбросе
+        _pending_tombstones[:0] = batch
+
+async def handle_edited_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сохранить новую версию отредактированного сообщения"""
+    message = update.edited_message
+    if not message:
+        return
+
+    Database.save_message_version(message)
+
+async def handle_delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /del: удалить сообщение (ответом) с записью в архив"""
+    target_message = update.effective_message.reply_to_message
+    if not target_message:
+        await update.message.reply_text("❌ Ответьте на сообщение командой /del")
+        return
+
+    user = update.effective_user
+    if not await is_chat_admin(context.bot, update.effective_chat.id, user.id):
+        await update.message.reply_text("❌ Эта команда только для администраторов!")
+        return
+
+    await delete_message(
+        context.bot,
+        update.effective_chat.id,
+        target_message.message_id,
+        reason='admin',
+        deleted_by=user.id
+    )
+    await update.effective_message.delete()
+
+def add_archive_handlers(application):
+    """Добавить обработчики архива: правки и удаления"""
+    application.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE, handle_edited_message))
+    application.add_handler(CommandHandler("del", handle_delete_command))
+    application.job_queue.run_repeating(
+        flush_tombstones,
+        interval=TOMBSTONE_FLUSH_INTERVAL,
+        first=TOMBSTONE_FLUSH_INTERVAL
+    )
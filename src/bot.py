@@ -13,6 +13,14 @@ from telegram.ext import (
 )
 from config import Config
 from database import Database
+from archive import add_archive_handlers
+from antiflood import admit_message
+from usernames import observe_user, resolve_username
+from expiry import expiry_scheduler, schedule_sanction
+from moderation import add_moderation_handlers
+from admission import add_admission_handlers, PriorityUpdateProcessor
+from admins import add_admin_handlers
+from cluster import cluster
 import html
 
 # Настройка логирования
@@ -24,11 +32,17 @@ logger = logging.getLogger(__name__)
 
 # Инициализация базы данных
 Database.initialize()
+Database.create_tables()
 
 async def save_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сохранить все сообщения"""
-    if update.effective_message:
-        Database.save_message_content(update.effective_message, context)
+    message = update.effective_message
+    if not message:
+        return
+    
+    observe_user(message.chat.id, message.from_user)
+    if await admit_message(message, context):
+        Database.save_message_content(message, context)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -146,22 +160,13 @@ async def handle_vote_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         target_username = context.args[0].replace('@', '')
         related_message_id = None
         
-        # Находим пользователя по username
-        conn = Database.get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    'SELECT user_id, first_name FROM users WHERE username = %s',
-                    (target_username,)
-                )
-                result = cur.fetchone()
-                if not result:
-                    await update.message.reply_text(f"❌ Пользователь @{target_username} не найден")
-                    return
-                target_user_id, first_name = result
-                target_username = target_username or first_name
-        finally:
-            Database.return_connection(conn)
+        # Находим пользователя по username (без учета регистра)
+        result = await resolve_username(update.effective_chat.id, target_username)
+        if not result:
+            await update.message.reply_text(f"❌ Пользователь @{target_username} не найден")
+            return
+        target_user_id, first_name = result
+        target_username = target_username or first_name
         target_user = type('obj', (object,), {'id': target_user_id, 'username': target_username})
     
     # Проверяем себя
@@ -188,35 +193,20 @@ async def handle_vote_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Создаем голосование
-    conn = Database.get_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO votes 
-                (chat_id, target_user_id, initiator_user_id, vote_type, 
-                 duration_minutes, reason, related_message_id, required_votes)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, 
-                        GREATEST(3, CAST((SELECT COUNT(*) FROM chat_members WHERE chat_id = %s) * 0.3 AS INTEGER)))
-                RETURNING vote_id
-            ''', (
-                update.effective_chat.id,
-                target_user.id,
-                update.effective_user.id,
-                'ban',
-                duration,
-                reason,
-                related_message_id,
-                update.effective_chat.id
-            ))
-            
-            vote_id = cur.fetchone()[0]
-        conn.commit()
+        vote_id = Database.create_vote(
+            chat_id=update.effective_chat.id,
+            target_user_id=target_user.id,
+            initiator_user_id=update.effective_user.id,
+            vote_type='ban',
+            duration_minutes=duration,
+            reason=reason,
+            related_message_id=related_message_id
+        )
     except Exception as e:
         logger.error(f"Error creating vote: {e}")
         await update.message.reply_text("❌ Ошибка при создании голосования")
         return
-    finally:
-        Database.return_connection(conn)
     
     # Формируем детальную информацию
     stats_text = f"""
@@ -268,31 +258,68 @@ async def handle_vote_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='HTML'
     )
     
+    # Таймеры голосования ведет лидер (в режиме одного процесса - этот процесс)
+    end_time = datetime.now() + timedelta(minutes=5)
+    Database.set_vote_message(vote_id, message.message_id, end_time)
+    
+    if cluster.is_leader:
+        schedule_vote_jobs(
+            context.job_queue,
+            (vote_id, update.effective_chat.id, message.message_id, target_user.id, duration, end_time)
+        )
+    cluster.publish('vote', vote_id=vote_id)
+
+# Голосования, таймеры которых уже запущены в этом процессе: vote_id -> jobs
+_scheduled_votes = {}
+
+def schedule_vote_jobs(job_queue, vote):
+    """Запустить обновление таймера и завершение голосования.
+
+    vote = (vote_id, chat_id, message_id, target_user_id, duration, end_time)
+    """
+    vote_id, chat_id, message_id, target_user_id, duration, end_time = vote
+    if vote_id in _scheduled_votes:
+        return
+    
     # Запускаем таймер обновления
-    context.job_queue.run_repeating(
+    timer_job = job_queue.run_repeating(
         update_vote_timer,
         interval=30,
         first=30,
         data={
-            'chat_id': update.effective_chat.id,
-            'message_id': message.message_id,
+            'chat_id': chat_id,
+            'message_id': message_id,
             'vote_id': vote_id,
-            'end_time': datetime.now() + timedelta(minutes=5)
+            'end_time': end_time
         }
     )
     
     # Запускаем завершение голосования
-    context.job_queue.run_once(
+    finish_job = job_queue.run_once(
         finish_vote,
-        300,
+        max(0, (end_time - datetime.now()).total_seconds()),
         data={
-            'chat_id': update.effective_chat.id,
+            'chat_id': chat_id,
             'vote_id': vote_id,
-            'message_id': message.message_id,
-            'target_user_id': target_user.id,
+            'message_id': message_id,
+            'target_user_id': target_user_id,
             'duration': duration
         }
     )
+    _scheduled_votes[vote_id] = [timer_job, finish_job]
+
+def resume_votes(job_queue, vote_id=None):
+    """Подхватить активные голосования (после рестарта, смены лидера или с другого экземпляра)"""
+    for vote in Database.get_active_votes(vote_id):
+        schedule_vote_jobs(job_queue, vote)
+
+def stop_votes():
+    """Снять таймеры голосований (лидерство перешло к другому экземпляру)"""
+    for jobs in _scheduled_votes.values():
+        for job in jobs:
+            if not job.removed:
+                job.schedule_removal()
+    _scheduled_votes.clear()
 
 async def update_vote_timer(context: CallbackContext):
     """Обновление таймера голосования"""
@@ -344,6 +371,62 @@ async def update_vote_timer(context: CallbackContext):
     except:
         pass  # Игнорируем ошибки редактирования
 
+async def finish_vote(context: CallbackContext):
+    """Завершение голосования"""
+    job_data = context.job.data
+    # Таймер обновления больше не нужен
+    for job in _scheduled_votes.pop(job_data['vote_id'], []):
+        if job is not context.job and not job.removed:
+            job.schedule_removal()
+    
+    conn = Database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('''
+                UPDATE votes SET is_active = FALSE
+                WHERE vote_id = %s AND is_active = TRUE
+                RETURNING votes_for, votes_against, required_votes, reason
+            ''', (job_data['vote_id'],))
+            
+            result = cur.fetchone()
+        conn.commit()
+    finally:
+        Database.return_connection(conn)
+    
+    if not result:
+        return
+    
+    votes_for, votes_against, required_votes, reason = result
+    duration = job_data['duration']
+    passed = votes_for >= required_votes and votes_for > votes_against
+    
+    if passed:
+        try:
+            await context.bot.ban_chat_member(
+                job_data['chat_id'],
+                job_data['target_user_id'],
+                until_date=datetime.now() + timedelta(minutes=duration)
+            )
+            # Снятие бана по сроку делает планировщик
+            schedule_sanction(job_data['chat_id'], job_data['target_user_id'], 'ban', duration, reason)
+            result_text = f"✅ Голосование #{job_data['vote_id']} завершено: бан на {duration} мин"
+        except Exception as e:
+            logger.error(f"Error banning user: {e}")
+            result_text = f"❌ Голосование #{job_data['vote_id']} прошло, но забанить не удалось"
+    else:
+        result_text = f"❌ Голосование #{job_data['vote_id']} не набрало голосов"
+    
+    result_text += f"\n📊 За: {votes_for} | Против: {votes_against} | Нужно: {required_votes}"
+    
+    try:
+        await context.bot.edit_message_text(
+            chat_id=job_data['chat_id'],
+            message_id=job_data['message_id'],
+            text=result_text
+        )
+    except:
+        pass  # Игнорируем ошибки редактирования
+
 async def show_vote_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать помощь по голосованиям"""
     help_text = """
@@ -449,8 +532,14 @@ async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
         with conn.cursor() as cur:
             # Определяем тип реакции
             reaction_emoji = reaction.new_reaction[0].emoji if reaction.new_reaction else None
+            # Реакции, которые пользователь снял или заменил
+            removed_emojis = (
+                {getattr(r, 'emoji', None) for r in reaction.old_reaction}
+                - {getattr(r, 'emoji', None) for r in reaction.new_reaction}
+                - {None}
+            )
             
-            if not reaction_emoji:
+            if not reaction_emoji and not removed_emojis:
                 return
             
             # Находим автора сообщения
@@ -465,6 +554,22 @@ async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             target_user_id = result[0]
             
+            # Снятые реакции убираем из сводки получателя
+            for emoji in removed_emojis:
+                cur.execute('''
+                    DELETE FROM message_reactions
+                    WHERE message_id = %s AND chat_id = %s AND user_id = %s AND reaction = %s
+                ''', (reaction.message_id, update.effective_chat.id, user.id, emoji))
+                if cur.rowcount == 1:
+                    cur.execute('''
+                        UPDATE reaction_stats SET count = count - 1
+                        WHERE chat_id = %s AND user_id = %s AND reaction = %s AND count > 0
+                    ''', (update.effective_chat.id, target_user_id, emoji))
+            
+            if not reaction_emoji:
+                conn.commit()
+                return
+            
             # Сохраняем реакцию
             try:
                 cur.execute('''
@@ -473,8 +578,18 @@ async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     VALUES (%s, %s, %s, %s)
                     ON CONFLICT (message_id, chat_id, user_id, reaction) DO NOTHING
                 ''', (reaction.message_id, update.effective_chat.id, user.id, reaction_emoji))
+                is_new_reaction = cur.rowcount == 1
             except:
-                pass  # Игнорируем дубликаты
+                is_new_reaction = False  # Игнорируем дубликаты
+            
+            # Обновляем сводку реакций получателя (только для новых реакций)
+            if is_new_reaction:
+                cur.execute('''
+                    INSERT INTO reaction_stats (chat_id, user_id, reaction, count)
+                    VALUES (%s, %s, %s, 1)
+                    ON CONFLICT (chat_id, user_id, reaction)
+                    DO UPDATE SET count = reaction_stats.count + 1
+                ''', (update.effective_chat.id, target_user_id, reaction_emoji))
             
             # Обновляем статистику пользователя
             if reaction_emoji in Database.POSITIVE_REACTIONS:
@@ -525,25 +640,11 @@ async def show_user_detailed_stats(update: Update, context: ContextTypes.DEFAULT
         await query.answer("Статистика не найдена", show_alert=True)
         return
     
-    # Получаем топ реакций
-    conn = Database.get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                SELECT reaction, COUNT(*) as count
-                FROM message_reactions 
-                WHERE user_id = %s
-                GROUP BY reaction
-                ORDER BY count DESC
-                LIMIT 10
-            ''', (user_id,))
-            
-            top_reactions = cur.fetchall()
-    finally:
-        Database.return_connection(conn)
+    # Получаем топ полученных реакций из сводной таблицы
+    top_reactions = Database.get_top_reactions(user_id, query.message.chat_id, limit=5)
     
     reactions_text = ""
-    for reaction, count in top_reactions[:5]:
+    for reaction, count in top_reactions:
         reactions_text += f"{reaction}: {count} раз\n"
     
     stats_text = f"""
@@ -574,31 +675,6 @@ async def show_user_detailed_stats(update: Update, context: ContextTypes.DEFAULT
     
     await query.answer(stats_text, show_alert=True)
 
-async def handle_message_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка удаленных сообщений"""
-    if not update.effective_message or not update.effective_message.delete_chat_photo:
-        return
-    
-    deleted_message = update.effective_message
-    
-    # Помечаем сообщение как удаленное в базе
-    conn = Database.get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute('''
-                UPDATE messages 
-                SET is_deleted = TRUE,
-                    deleted_at = CURRENT_TIMESTAMP
-                WHERE message_id = %s AND chat_id = %s
-            ''', (deleted_message.message_id, deleted_message.chat.id))
-        conn.commit()
-        
-        logger.info(f"Message {deleted_message.message_id} marked as deleted")
-    except Exception as e:
-        logger.error(f"Error marking message as deleted: {e}")
-    finally:
-        Database.return_connection(conn)
-
 async def auto_save_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Автоматическое сохранение медиа-контента"""
     message = update.effective_message
@@ -606,6 +682,12 @@ async def auto_save_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message:
         return
     
+    observe_user(message.chat.id, message.from_user)
+    
+    # Флуд и повторы не попадают в архив
+    if not await admit_message(message, context):
+        return
+    
     # Сохраняем все типы сообщений
     Database.save_message_content(message, context)
     
@@ -630,7 +712,16 @@ async def setup_admin_commands(update: Update, context: ContextTypes.DEFAULT_TYP
 
 def main():
     """Основная функция запуска бота"""
-    application = Application.builder().token(Config.TOKEN).build()
+    # Команды и кнопки обрабатываются параллельно с архивацией, а не в общей очереди
+    application = (
+        Application.builder()
+        .token(Config.TOKEN)
+        .concurrent_updates(PriorityUpdateProcessor())
+        .build()
+    )
+    
+    # Контроль нагрузки: при перегрузке архивация и реакции уступают командам и кнопкам
+    add_admission_handlers(application)
     
     # Базовые команды
     application.add_handler(CommandHandler("start", start))
@@ -649,15 +740,39 @@ def main():
     application.add_handler(CallbackQueryHandler(handle_vote_button, pattern="^vote:"))
     
     # Обработчики сообщений
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, save_message))
-    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.ALL, auto_save_media))
+    # Только новые сообщения: правки обрабатывает архив (add_archive_handlers)
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.UpdateType.MESSAGE, save_message
+    ))
+    application.add_handler(MessageHandler(
+        (filters.PHOTO | filters.Document.ALL) & filters.UpdateType.MESSAGE, auto_save_media
+    ))
     application.add_handler(MessageHandler(filters.REACTION, handle_reaction))
     application.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER | 
                                           filters.StatusUpdate.NEW_CHAT_MEMBERS, 
                                           save_message))
     
-    # Обработчик удаленных сообщений
-    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE, handle_message_delete))
+    # Панель модерации
+    add_moderation_handlers(application)
+    
+    # Правки и удаления сообщений
+    add_archive_handlers(application)
+    
+    # Сброс кэша администраторов
+    add_admin_handlers(application)
+    
+    # Таймеры голосований и снятие наказаний по сроку работают только на лидере
+    cluster.on_leader(expiry_scheduler.start)
+    cluster.on_leader(resume_votes)
+    cluster.on_follower(expiry_scheduler.stop)
+    cluster.on_follower(stop_votes)
+    
+    def on_vote_created(payload):
+        if cluster.is_leader:
+            resume_votes(application.job_queue, payload['vote_id'])
+    
+    cluster.on('vote', on_vote_created)
+    cluster.start(application.job_queue)
     
     # Запуск
     if Config.WEBHOOK_HOST:
@@ -668,12 +783,14 @@ def main():
             port=Config.PORT,
             url_path=Config.WEBHOOK_PATH,
             webhook_url=Config.WEBHOOK_URL,
-            drop_pending_updates=True
+            allowed_updates=Update.ALL_TYPES,
+            # Несколько экземпляров перезапускаются по очереди - не теряем обновления
+            drop_pending_updates=not Config.MULTI_INSTANCE
         )
     else:
         # Polling для локальной разработки
         logger.info("Starting polling...")
-        application.run_polling(drop_pending_updates=True)
+        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,144 @@
+from collections import Counter
+from database import Database
+import csv
+import io
+import logging
+import tempfile
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк за раз читаем с серверного курсора
+CHUNK_SIZE = 2000
+# Сколько участников показываем в топе
+TOP_CONTRIBUTORS = 20
+
+# Выгружаемые таблицы: имя файла -> (заголовок, запрос)
+EXPORT_QUERIES = {
+    'messages.csv': (
+        ['message_id', 'user_id', 'message_type', 'created_at'],
+        '''
+        SELECT message_id, user_id, message_type, created_at
+        FROM messages WHERE chat_id = %s
+        ORDER BY message_id
+        '''
+    ),
+    'reactions.csv': (
+        ['message_id', 'user_id', 'reaction'],
+        '''
+        SELECT message_id, user_id, reaction
+        FROM message_reactions WHERE chat_id = %s
+        '''
+    ),
+    'reports.csv': (
+        ['report_id', 'reporter_id', 'reported_user_id', 'message_id', 'report_type', 'status', 'created_at'],
+        '''
+        SELECT report_id, reporter_id, reported_user_id, message_id, report_type, status, created_at
+        FROM reports WHERE chat_id = %s
+        ORDER BY report_id
+        '''
+    ),
+    'votes.csv': (
+        ['vote_id', 'target_user_id', 'initiator_user_id', 'vote_type', 'votes_for', 'votes_against', 'is_active'],
+        '''
+        SELECT vote_id, target_user_id, initiator_user_id, vote_type, votes_for, votes_against, is_active
+        FROM votes WHERE chat_id = %s
+        ORDER BY vote_id
+        '''
+    ),
+}
+
+def _stream_rows(conn, name, sql, params):
+    """Читать запрос серверным курсором порциями по CHUNK_SIZE строк"""
+    with conn.cursor(name=name) as cur:
+        cur.itersize = CHUNK_SIZE
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+class _ChatAggregates:
+    """Сводка, которая считается по ходу выгрузки"""
+
+    def __init__(self):
+        self.messages_by_hour = [0] * 24
+        self.messages_by_user = Counter()
+        self.reaction_mix = Counter()
+        self.reports_by_status = Counter()
+        self.votes_by_outcome = Counter()
+
+    def add(self, filename, row):
+        if filename == 'messages.csv':
+            _, user_id, _, created_at = row
+            if created_at:
+                self.messages_by_hour[created_at.hour] += 1
+            self.messages_by_user[user_id] += 1
+        elif filename == 'reactions.csv':
+            self.reaction_mix[row[2]] += 1
+        elif filename == 'reports.csv':
+            self.reports_by_status[row[5]] += 1
+        elif filename == 'votes.csv':
+            _, _, _, _, votes_for, votes_against, is_active = row
+            if is_active:
+                outcome = 'active'
+            else:
+                outcome = 'for' if (votes_for or 0) > (votes_against or 0) else 'against'
+            self.votes_by_outcome[outcome] += 1
+
+    def write(self, writer):
+        writer.writerow(['section', 'key', 'value'])
+        for hour, count in enumerate(self.messages_by_hour):
+            writer.writerow(['messages_by_hour', f'{hour:02d}:00', count])
+        for user_id, count in self.messages_by_user.most_common(TOP_CONTRIBUTORS):
+            writer.writerow(['top_contributors', user_id, count])
+        for reaction, count in self.reaction_mix.most_common():
+            writer.writerow(['reaction_mix', reaction, count])
+        for status, count in self.reports_by_status.items():
+            writer.writerow(['reports_by_status', status, count])
+        for outcome, count in self.votes_by_outcome.items():
+            writer.writerow(['votes_by_outcome', outcome, count])
+
+def build_chat_export(chat_id):
+    """Собрать zip с выгрузкой чата во временный файл и вернуть его открытым.
+
+    Строки идут с серверных курсоров сразу в архив, поэтому память не
+    зависит от размера истории чата. Функция блокирующая - вызывать
+    через asyncio.to_thread.
+    """
+    output = tempfile.TemporaryFile()
+    aggregates = _ChatAggregates()
+
+    conn = Database.get_connection()
+    try:
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for filename, (header, sql) in EXPORT_QUERIES.items():
+                with archive.open(filename, 'w') as raw:
+                    stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                    writer = csv.writer(stream)
+                    writer.writerow(header)
+                    cursor_name = f"export_{filename.split('.')[0]}"
+                    for row in _stream_rows(conn, cursor_name, sql, (chat_id,)):
+                        writer.writerow(row)
+                        aggregates.add(filename, row)
+                    stream.flush()
+                    stream.detach()
+
+            with archive.open('summary.csv', 'w') as raw:
+                stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                aggregates.write(csv.writer(stream))
+                stream.flush()
+                stream.detach()
+        # Серверные курсоры живут внутри транзакции
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        output.close()
+        raise
+    finally:
+        Database.return_connection(conn)
+
+    output.seek(0)
+    logger.info(f"Chat {chat_id} exported")
+    return output
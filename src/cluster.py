@@ -0,0 +1,168 @@
+from telegram.ext import CallbackContext
+from config import Config
+from database import Database
+import asyncio
+import json
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres для событий между экземплярами бота
+CHANNEL = 'bot_events'
+# Ключ advisory-lock, которым держится лидерство
+LEADER_LOCK_KEY = 727001
+# Как часто проверяем лидерство и соединение LISTEN (секунды)
+ELECTION_INTERVAL = 10
+
+INSTANCE_ID = os.getenv('RENDER_INSTANCE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+class Cluster:
+    """Координация нескольких экземпляров бота через Postgres.
+
+    Лидер (держатель advisory-lock) ведет таймеры голосований и снятие
+    наказаний; события об изменениях (пользователи, голосования, админы)
+    рассылаются через LISTEN/NOTIFY. В режиме одного процесса этот
+    экземпляр всегда лидер, а publish() ничего не отправляет.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.is_leader = False
+        self._handlers = {}
+        self._leader_callbacks = []
+        self._follower_callbacks = []
+        self._lock_conn = None
+        self._listen_conn = None
+        self._listen_fd = None
+
+    def on(self, kind, handler):
+        """Подписаться на события от других экземпляров: handler(payload)"""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def on_leader(self, callback):
+        """callback(job_queue) - этот экземпляр стал лидером"""
+        self._leader_callbacks.append(callback)
+
+    def on_follower(self, callback):
+        """callback() - этот экземпляр потерял лидерство"""
+        self._follower_callbacks.append(callback)
+
+    def start(self, job_queue):
+        self.enabled = Config.MULTI_INSTANCE and Database.backend.name == 'postgres' and bool(Config.DATABASE_URL)
+        if Config.MULTI_INSTANCE and not self.enabled:
+            logger.warning("Multi-instance mode needs Postgres, running as a single instance")
+
+        if not self.enabled:
+            self._become_leader(job_queue)
+            return
+
+        logger.info(f"Instance {INSTANCE_ID} joining cluster")
+        job_queue.run_repeating(self._maintain, interval=ELECTION_INTERVAL, first=0)
+
+    def publish(self, kind, **payload):
+        """Сообщить остальным экземплярам о событии (себе не доставляется)"""
+        if not self.enabled:
+            return
+        payload.update(kind=kind, instance=INSTANCE_ID)
+        try:
+            Database.notify(CHANNEL, json.dumps(payload, default=str))
+        except Exception as e:
+            logger.error(f"Error publishing {kind} event: {e}")
+
+    def _become_leader(self, job_queue):
+        self.is_leader = True
+        logger.info(f"Instance {INSTANCE_ID} is the leader")
+        for callback in self._leader_callbacks:
+            callback(job_queue)
+
+    def _lose_leadership(self):
+        self.is_leader = False
+        logger.warning(f"Instance {INSTANCE_ID} lost leadership")
+        for callback in self._follower_callbacks:
+            callback()
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(Config.DATABASE_URL)
+        conn.autocommit = True
+        return conn
+
+    def _try_lock(self):
+        """Взять или подтвердить лидерство; lock живет, пока живо соединение"""
+        reconnected = self._lock_conn is None or self._lock_conn.closed
+        if reconnected:
+            self._lock_conn = self._connect()
+        with self._lock_conn.cursor() as cur:
+            # Со старым соединением пропал и lock - после переподключения берем его заново
+            if self.is_leader and not reconnected:
+                cur.execute('SELECT 1')
+                return True
+            cur.execute('SELECT pg_try_advisory_lock(%s)', (LEADER_LOCK_KEY,))
+            return cur.fetchone()[0]
+
+    def _listen(self, loop):
+        self._listen_conn = self._connect()
+        with self._listen_conn.cursor() as cur:
+            cur.execute(f'LISTEN {CHANNEL}')
+        # Дескриптор запоминаем: у закрытого соединения fileno() уже не вызвать
+        self._listen_fd = self._listen_conn.fileno()
+        loop.add_reader(self._listen_fd, self._on_notify)
+
+    def _stop_listening(self, loop):
+        """Снять reader со старого дескриптора и закрыть соединение LISTEN"""
+        conn = self._listen_conn
+        try:
+            if self._listen_fd is not None:
+                loop.remove_reader(self._listen_fd)
+        finally:
+            self._listen_conn = None
+            self._listen_fd = None
+            if conn is not None:
+                conn.close()
+
+    def _on_notify(self):
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            logger.error(f"LISTEN connection lost: {e}")
+            self._stop_listening(asyncio.get_running_loop())
+            return
+
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            payload = json.loads(notify.payload)
+            if payload.get('instance') == INSTANCE_ID:
+                continue
+            for handler in self._handlers.get(payload.get('kind'), []):
+                try:
+                    handler(payload)
+                except Exception as e:
+                    logger.error(f"Error handling {payload.get('kind')} event: {e}")
+
+    async def _maintain(self, context: CallbackContext):
+        """Периодически: переподключить LISTEN и проверить/захватить лидерство"""
+        if self._listen_conn is None or self._listen_conn.closed:
+            loop = asyncio.get_running_loop()
+            self._stop_listening(loop)
+            try:
+                self._listen(loop)
+            except Exception as e:
+                logger.error(f"Error starting LISTEN: {e}")
+                self._stop_listening(loop)
+
+        try:
+            leader = await asyncio.to_thread(self._try_lock)
+        except Exception as e:
+            logger.error(f"Leader election failed: {e}")
+            self._lock_conn = None
+            leader = False
+
+        if leader and not self.is_leader:
+            self._become_leader(context.job_queue)
+        elif not leader and self.is_leader:
+            self._lose_leadership()
+
+cluster = Cluster()
@@ -10,6 +10,13 @@ class Config:
     # Render automatically provides this
     DATABASE_URL = os.getenv('DATABASE_URL')
     
+    # Хранилище: 'postgres' (DATABASE_URL) или 'sqlite' (встроенная база в файле)
+    DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'postgres')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'bot.db')
+    
+    # Несколько экземпляров за одним webhook (координация через Postgres)
+    MULTI_INSTANCE = os.getenv('MULTI_INSTANCE', '').lower() in ('1', 'true', 'yes')
+    
     # Server settings
     PORT = int(os.getenv('PORT', 10000))
     HOST = '0.0.0.0'
@@ -1,22 +1,719 @@
-# Временная заглушка для базы данных
+# Доступ к базе данных: Postgres (DATABASE_URL) или встроенная SQLite
+from datetime import datetime
 import logging
+from cache import LRUCache
+from config import Config
 logger = logging.getLogger(__name__)
 
+# Типы медиа, которые храним в таблице media_files по file_unique_id
+MEDIA_TYPES = ['photo', 'document', 'video', 'animation', 'audio', 'voice', 'video_note', 'sticker']
+
+def _extract_media(message):
+    """Вернуть (тип сообщения, медиа-объект или None)"""
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type, None)
+        if media:
+            # Для фото берем самый большой размер
+            if media_type == 'photo':
+                media = media[-1]
+            return media_type, media
+    return ('text' if message.text else 'service'), None
+
+class PostgresBackend:
+    """Postgres по DATABASE_URL; без адреса работает как заглушка (соединений нет)"""
+
+    name = 'postgres'
+    # Дополнительные таблицы, которые создаются поверх основной схемы
+    SCHEMA = [
+        # Сводка реакций: сколько раз получатель получил каждый эмодзи в чате
+        '''
+        CREATE TABLE IF NOT EXISTS reaction_stats (
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            reaction TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id, reaction)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reaction_stats_top
+            ON reaction_stats (chat_id, user_id, count DESC)
+        ''',
+        # Однократное заполнение сводки из уже накопленных реакций
+        '''
+        INSERT INTO reaction_stats (chat_id, user_id, reaction, count)
+        SELECT mr.chat_id, m.user_id, mr.reaction, COUNT(*)
+        FROM message_reactions mr
+        JOIN messages m ON m.message_id = mr.message_id AND m.chat_id = mr.chat_id
+        WHERE NOT EXISTS (SELECT 1 FROM reaction_stats)
+        GROUP BY mr.chat_id, m.user_id, mr.reaction
+        ''',
+        # Версии отредактированных сообщений (исходник остается в messages)
+        '''
+        CREATE TABLE IF NOT EXISTS message_versions (
+            message_id BIGINT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            version INTEGER NOT NULL,
+            content TEXT,
+            caption TEXT,
+            edited_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id, version)
+        )
+        ''',
+        # Удаленные сообщения: кем и почему
+        '''
+        CREATE TABLE IF NOT EXISTS message_tombstones (
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            reason TEXT NOT NULL,
+            deleted_by BIGINT,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id)
+        )
+        ''',
+        # Медиафайлы хранятся один раз, сообщения ссылаются на них по file_unique_id
+        '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            file_size BIGINT,
+            mime_type TEXT,
+            file_name TEXT,
+            post_count INTEGER NOT NULL DEFAULT 1,
+            first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS media_unique_id TEXT
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_messages_media
+            ON messages (media_unique_id) WHERE media_unique_id IS NOT NULL
+        ''',
+        # Поиск по username без учета регистра
+        '''
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS username_lower TEXT
+            GENERATED ALWAYS AS (LOWER(username)) STORED
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (username_lower)
+        ''',
+        # Наказания со сроком: бан, мут, предупреждение
+        '''
+        CREATE TABLE IF NOT EXISTS sanctions (
+            sanction_id SERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            sanction_type TEXT NOT NULL,
+            reason TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            expired_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sanctions_pending
+            ON sanctions (expires_at) WHERE expired_at IS NULL
+        ''',
+        # Жалобы на одно и то же сообщение собираются в один кластер
+        '''
+        CREATE TABLE IF NOT EXISTS report_clusters (
+            cluster_id SERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT,
+            reported_user_id BIGINT NOT NULL,
+            report_type TEXT,
+            reason TEXT,
+            report_count INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            resolved_by BIGINT,
+            resolved_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_report_clusters_pending
+            ON report_clusters (chat_id, message_id, reported_user_id) WHERE status = 'pending'
+        ''',
+        '''
+        ALTER TABLE reports ADD COLUMN IF NOT EXISTS cluster_id INTEGER
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reports_cluster ON reports (cluster_id)
+        ''',
+        # Разложить по кластерам жалобы, созданные до их появления
+        '''
+        INSERT INTO report_clusters
+        (chat_id, message_id, reported_user_id, report_type, reason, report_count, created_at)
+        SELECT chat_id, message_id, reported_user_id, MIN(report_type), MIN(reason), COUNT(*), MIN(created_at)
+        FROM reports
+        WHERE status = 'pending' AND cluster_id IS NULL
+        GROUP BY chat_id, message_id, reported_user_id
+        ON CONFLICT (chat_id, message_id, reported_user_id) WHERE status = 'pending'
+        DO UPDATE SET report_count = report_clusters.report_count + EXCLUDED.report_count
+        ''',
+        '''
+        UPDATE reports r
+        SET cluster_id = c.cluster_id
+        FROM report_clusters c
+        WHERE r.cluster_id IS NULL AND r.status = 'pending' AND c.status = 'pending'
+          AND c.chat_id = r.chat_id AND c.message_id = r.message_id
+          AND c.reported_user_id = r.reported_user_id
+        ''',
+        # Сообщение и время окончания голосования, чтобы таймеры пережили рестарт
+        '''
+        ALTER TABLE votes ADD COLUMN IF NOT EXISTS vote_message_id BIGINT
+        ''',
+        '''
+        ALTER TABLE votes ADD COLUMN IF NOT EXISTS ends_at TIMESTAMP
+        ''',
+    ]
+
+    def __init__(self, dsn):
+        self._pool = None
+        if dsn:
+            from psycopg2.pool import ThreadedConnectionPool
+            self._pool = ThreadedConnectionPool(1, 10, dsn)
+
+    def get_connection(self):
+        return self._pool.getconn() if self._pool else None
+
+    def return_connection(self, conn):
+        if self._pool and conn is not None:
+            self._pool.putconn(conn)
+
+    def migrate(self, cur):
+        # Новые колонки добавляются в SCHEMA через ADD COLUMN IF NOT EXISTS
+        pass
+
+    def record_tombstones(self, cur, rows):
+        """Записать удаления пачкой: rows = [(chat_id, message_id, reason, deleted_by, deleted_at)]"""
+        from psycopg2.extras import execute_values
+        execute_values(cur, '''
+            INSERT INTO message_tombstones
+            (chat_id, message_id, reason, deleted_by, deleted_at)
+            VALUES %s
+            ON CONFLICT (chat_id, message_id) DO NOTHING
+        ''', rows)
+
+        execute_values(cur, '''
+            UPDATE messages m
+            SET is_deleted = TRUE,
+                deleted_at = v.deleted_at
+            FROM (VALUES %s) AS v(chat_id, message_id, deleted_at)
+            WHERE m.chat_id = v.chat_id AND m.message_id = v.message_id
+        ''', [(chat_id, message_id, deleted_at) for chat_id, message_id, _, _, deleted_at in rows])
+
 class Database:
+    # Хранилище выбирается в initialize(): PostgresBackend или SQLiteBackend
+    backend = None
+
+    POSITIVE_REACTIONS = ['👍', '❤️', '🔥', '🥰', '👏', '😁', '🎉', '🤩', '💯']
+    NEGATIVE_REACTIONS = ['👎', '💩', '🤮', '😡', '🤬']
+
+    # Кэш file_unique_id -> (media_type, file_id) для просмотра архива
+    _media_cache = LRUCache(maxsize=2048)
+
     @classmethod
     def initialize(cls):
-        logger.info("Database initialized (mock mode)")
-    
+        if Config.DATABASE_BACKEND == 'sqlite':
+            from sqlite_backend import SQLiteBackend
+            cls.backend = SQLiteBackend(Config.SQLITE_PATH)
+            logger.info(f"Database initialized (sqlite: {Config.SQLITE_PATH})")
+        else:
+            cls.backend = PostgresBackend(Config.DATABASE_URL)
+            logger.info("Database initialized" if Config.DATABASE_URL else "Database initialized (mock mode)")
+
     @classmethod
     def get_connection(cls):
-        return None
-    
+        return cls.backend.get_connection()
+
     @classmethod
     def return_connection(cls, conn):
-        pass
-    
+        cls.backend.return_connection(conn)
+
     @classmethod
     def create_tables(cls):
-        logger.info("Tables checked (mock mode)")
+        conn = cls.get_connection()
+        if conn is None:
+            logger.info("Tables checked (mock mode)")
+            return
+        try:
+            with conn.cursor() as cur:
+                for statement in cls.backend.SCHEMA:
+                    cur.execute(statement)
+                cls.backend.migrate(cur)
+            conn.commit()
+        finally:
             cls.return_connection(conn)
 
+    @classmethod
+    def record_tombstones(cls, rows):
+        """Записать пачку удалений одной транзакцией"""
+        conn = cls.get_connection()
+        if conn is None:
+            return
+        try:
+            with conn.cursor() as cur:
+                cls.backend.record_tombstones(cur, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def create_vote(cls, chat_id, target_user_id, initiator_user_id, vote_type,
+                    duration_minutes, reason, related_message_id):
+        """Создать голосование, вернуть vote_id.
+
+        Нужно не меньше 3 голосов и не меньше 30% участников чата.
+        """
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT CAST(COUNT(*) * 0.3 AS INTEGER) FROM chat_members WHERE chat_id = %s
+                ''', (chat_id,))
+                required_votes = max(3, cur.fetchone()[0])
+
+                cur.execute('''
+                    INSERT INTO votes
+                    (chat_id, target_user_id, initiator_user_id, vote_type,
+                     duration_minutes, reason, related_message_id, required_votes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING vote_id
+                ''', (
+                    chat_id,
+                    target_user_id,
+                    initiator_user_id,
+                    vote_type,
+                    duration_minutes,
+                    reason,
+                    related_message_id,
+                    required_votes
+                ))
+                vote_id = cur.fetchone()[0]
+            conn.commit()
+            return vote_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def set_vote_message(cls, vote_id, message_id, ends_at):
+        """Запомнить сообщение голосования и время его окончания"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE votes SET vote_message_id = %s, ends_at = %s
+                    WHERE vote_id = %s
+                ''', (message_id, ends_at, vote_id))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def get_active_votes(cls, vote_id=None):
+        """Активные голосования с таймером:
+        [(vote_id, chat_id, vote_message_id, target_user_id, duration_minutes, ends_at)]
+        """
+        conn = cls.get_connection()
+        if conn is None:
+            return []
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT vote_id, chat_id, vote_message_id, target_user_id, duration_minutes, ends_at
+                    FROM votes
+                    WHERE is_active = TRUE AND ends_at IS NOT NULL
+                      AND (%s IS NULL OR vote_id = %s)
+                ''', (vote_id, vote_id))
+                return cur.fetchall()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def notify(cls, channel, payload):
+        """Отправить событие через Postgres NOTIFY"""
+        conn = cls.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_notify(%s, %s)', (channel, payload))
+            conn.commit()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def get_user_statistics(cls, user_id, chat_id):
+        """Статистика пользователя для голосований и карточки (None, если не найден)"""
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT username, first_name, rating, positive_reactions,
+                           negative_reactions, neutral_reactions, warnings, created_at
+                    FROM users WHERE user_id = %s
+                ''', (user_id,))
+                user = cur.fetchone()
+                if not user:
+                    return None
+
+                cur.execute('''
+                    SELECT COUNT(*), COALESCE(SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END), 0)
+                    FROM reports
+                    WHERE reported_user_id = %s AND chat_id = %s
+                ''', (user_id, chat_id))
+                reports_received, pending_reports = cur.fetchone()
+
+                cur.execute('''
+                    SELECT reason FROM reports
+                    WHERE reported_user_id = %s AND chat_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT 3
+                ''', (user_id, chat_id))
+                report_reasons = [row[0] for row in cur.fetchall()]
+
+                cur.execute('''
+                    SELECT reason FROM sanctions
+                    WHERE user_id = %s AND chat_id = %s
+                      AND sanction_type = 'warning' AND expired_at IS NULL
+                    ORDER BY expires_at
+                ''', (user_id, chat_id))
+                warning_reasons = [row[0] for row in cur.fetchall() if row[0]]
+        finally:
+            cls.return_connection(conn)
+
+        username, first_name, rating, positive, negative, neutral, warnings, created_at = user
+        return {
+            'username': username,
+            'first_name': first_name,
+            'rating': rating,
+            'positive_reactions': positive,
+            'negative_reactions': negative,
+            'neutral_reactions': neutral,
+            'warnings': warnings,
+            'reports_received': reports_received,
+            'pending_reports': pending_reports,
+            'report_reasons': ', '.join(report_reasons),
+            'active_warnings': len(warning_reasons),
+            'warning_reasons': '\n'.join(f"• {reason}" for reason in warning_reasons),
+            'join_date': created_at.strftime('%d.%m.%Y') if created_at else 'неизвестно'
+        }
+
+    @classmethod
+    def get_top_reactions(cls, user_id, chat_id, limit=5):
+        """Топ реакций, полученных пользователем в чате: [(reaction, count), ...]"""
+        conn = cls.get_connection()
+        if conn is None:
+            return []
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT reaction, count
+                    FROM reaction_stats
+                    WHERE chat_id = %s AND user_id = %s AND count > 0
+                    ORDER BY count DESC
+                    LIMIT %s
+                ''', (chat_id, user_id, limit))
+                return cur.fetchall()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def save_message_content(cls, message, context=None):
+        """Сохранить сообщение в архив; медиа сохраняется один раз по file_unique_id"""
+        message_type, media = _extract_media(message)
+        media_unique_id = media.file_unique_id if media else None
+
+        conn = cls.get_connection()
+        if conn is None:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO messages
+                    (message_id, chat_id, user_id, message_type, content, caption, media_unique_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (message_id, chat_id) DO NOTHING
+                ''', (
+                    message.message_id,
+                    message.chat.id,
+                    message.from_user.id if message.from_user else None,
+                    message_type,
+                    message.text,
+                    message.caption,
+                    media_unique_id
+                ))
+
+                # Повторно сохраненное сообщение не считаем новой публикацией
+                if media and cur.rowcount == 1:
+                    cur.execute('''
+                        INSERT INTO media_files
+                        (file_unique_id, file_id, media_type, file_size, mime_type, file_name)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (file_unique_id) DO UPDATE
+                        SET post_count = media_files.post_count + 1,
+                            last_seen_at = CURRENT_TIMESTAMP
+                    ''', (
+                        media_unique_id,
+                        media.file_id,
+                        message_type,
+                        getattr(media, 'file_size', None),
+                        getattr(media, 'mime_type', None),
+                        getattr(media, 'file_name', None)
+                    ))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving message: {e}")
+            conn.rollback()
+            return
+        finally:
+            cls.return_connection(conn)
+
+        if media:
+            cls._media_cache.set(media_unique_id, (message_type, media.file_id))
+
+    @classmethod
+    def save_message_version(cls, message):
+        """Сохранить правку сообщения очередной версией (исходник остается в messages)"""
+        conn = cls.get_connection()
+        if conn is None:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO message_versions
+                    (message_id, chat_id, version, content, caption, edited_at)
+                    SELECT %s, %s, COALESCE(MAX(version), 0) + 1, %s, %s, %s
+                    FROM message_versions
+                    WHERE message_id = %s AND chat_id = %s
+                ''', (
+                    message.message_id,
+                    message.chat.id,
+                    message.text,
+                    message.caption,
+                    message.edit_date or datetime.now(),
+                    message.message_id,
+                    message.chat.id
+                ))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving message edit: {e}")
+            conn.rollback()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def upsert_user(cls, user_id, username, first_name):
+        """Создать пользователя или обновить его username / имя"""
+        conn = cls.get_connection()
+        if conn is None:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO users (user_id, username, first_name)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET username = EXCLUDED.username,
+                        first_name = EXCLUDED.first_name
+                ''', (user_id, username, first_name))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving user: {e}")
+            conn.rollback()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def find_user_by_username(cls, username):
+        """(user_id, username, first_name) по username без учета регистра"""
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    'SELECT user_id, username, first_name FROM users WHERE username_lower = LOWER(%s)',
+                    (username,)
+                )
+                return cur.fetchone()
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def create_report(cls, reporter_id, reported_user_id, message_id, chat_id, reason, report_type='abuse'):
+        """Создать жалобу, вернуть report_id (None при ошибке)"""
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                # Жалобы на то же сообщение того же пользователя попадают в один кластер
+                cur.execute('''
+                    INSERT INTO report_clusters
+                    (chat_id, message_id, reported_user_id, report_type, reason)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (chat_id, message_id, reported_user_id) WHERE status = 'pending'
+                    DO UPDATE SET report_count = report_clusters.report_count + 1,
+                                  updated_at = CURRENT_TIMESTAMP
+                    RETURNING cluster_id
+                ''', (chat_id, message_id, reported_user_id, report_type, reason))
+                cluster_id = cur.fetchone()[0]
+
+                cur.execute('''
+                    INSERT INTO reports
+                    (reporter_id, reported_user_id, message_id, chat_id, reason, report_type, cluster_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING report_id
+                ''', (reporter_id, reported_user_id, message_id, chat_id, reason, report_type, cluster_id))
+                report_id = cur.fetchone()[0]
+            conn.commit()
+            return report_id
+        except Exception as e:
+            logger.error(f"Error creating report: {e}")
+            conn.rollback()
+            return None
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def close_report_cluster(cls, cluster_id, chat_id, status, resolved_by):
+        """Закрыть кластер и все его жалобы одной транзакцией.
+
+        Возвращает (message_id, reported_user_id, report_count) или None,
+        если кластер уже закрыт.
+        """
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE report_clusters
+                    SET status = %s,
+                        resolved_by = %s,
+                        resolved_at = CURRENT_TIMESTAMP
+                    WHERE cluster_id = %s AND chat_id = %s AND status = 'pending'
+                    RETURNING message_id, reported_user_id, report_count
+                ''', (status, resolved_by, cluster_id, chat_id))
+                result = cur.fetchone()
+
+                if result:
+                    cur.execute('''
+                        UPDATE reports SET status = %s
+                        WHERE cluster_id = %s AND status = 'pending'
+                    ''', (status, cluster_id))
+            conn.commit()
+            return result
+        except Exception as e:
+            logger.error(f"Error closing report cluster: {e}")
+            conn.rollback()
+            return None
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def create_sanction(cls, chat_id, user_id, sanction_type, expires_at, reason=None):
+        """Записать наказание со сроком, вернуть sanction_id"""
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO sanctions (chat_id, user_id, sanction_type, reason, expires_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING sanction_id
+                ''', (chat_id, user_id, sanction_type, reason, expires_at))
+                sanction_id = cur.fetchone()[0]
+
+                if sanction_type == 'ban':
+                    cur.execute('UPDATE users SET is_banned = TRUE WHERE user_id = %s', (user_id,))
+            conn.commit()
+            return sanction_id
+        except Exception as e:
+            logger.error(f"Error creating sanction: {e}")
+            conn.rollback()
+            return None
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def get_media(cls, file_unique_id):
+        """(media_type, file_id) по file_unique_id, с кэшем"""
+        cached = cls._media_cache.get(file_unique_id)
+        if cached:
+            return cached
+
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT media_type, file_id FROM media_files
+                    WHERE file_unique_id = %s
+                ''', (file_unique_id,))
+                result = cur.fetchone()
+        finally:
+            cls.return_connection(conn)
+
+        if result:
+            cls._media_cache.set(file_unique_id, tuple(result))
+        return result
+
+    @classmethod
+    def get_media_post_count(cls, file_unique_id):
+        """Сколько раз этот же файл публиковался (для обнаружения спама)"""
+        conn = cls.get_connection()
+        if conn is None:
+            return 0
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    'SELECT post_count FROM media_files WHERE file_unique_id = %s',
+                    (file_unique_id,)
+                )
+                result = cur.fetchone()
+                return result[0] if result else 0
+        finally:
+            cls.return_connection(conn)
+
+    @classmethod
+    def get_message_content(cls, message_id, chat_id):
+        """(message_type, content, photo_url, file_id, caption) сохраненного сообщения"""
+        conn = cls.get_connection()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT message_type, content, photo_url, file_id, caption, media_unique_id
+                    FROM messages
+                    WHERE message_id = %s AND chat_id = %s
+                ''', (message_id, chat_id))
+                result = cur.fetchone()
+        finally:
+            cls.return_connection(conn)
+
+        if not result:
+            return None
+
+        message_type, content, photo_url, file_id, caption, media_unique_id = result
+        # Старые записи хранят file_id прямо в messages
+        if media_unique_id and not file_id:
+            media = cls.get_media(media_unique_id)
+            if media:
+                file_id = media[1]
+        return message_type, content, photo_url, file_id, caption
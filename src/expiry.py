@@ -0,0 +1,236 @@
+from telegram import ChatPermissions
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.ext import CallbackContext
+from datetime import datetime, timedelta
+from database import Database
+from cluster import cluster
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Насколько вперед подгружаем сроки из базы
+LOAD_WINDOW = timedelta(hours=6)
+# Сколько сроков подгружаем и обрабатываем за раз
+LOAD_LIMIT = 1000
+BATCH_SIZE = 100
+
+class ExpiryScheduler:
+    """Куча ближайших сроков окончания банов, мутов и предупреждений.
+
+    В памяти лежат только сроки до loaded_until; остальные подгружаются
+    из базы по индексу на expires_at, когда до них доходит очередь.
+    Между сроками работает один отложенный job, без опроса таблиц.
+    """
+
+    def __init__(self):
+        self._heap = []  # (expires_at, sanction_id)
+        self._queued = set()
+        self._loaded_until = None
+        self._job_queue = None
+        self._job = None
+        self._next_run = None
+
+    def start(self, job_queue):
+        """Запустить планировщик: первая подгрузка сроков сразу после старта"""
+        self._job_queue = job_queue
+        self._schedule(datetime.now())
+
+    def stop(self):
+        """Остановить планировщик (лидерство перешло к другому экземпляру)"""
+        if self._job:
+            self._job.schedule_removal()
+        self._job_queue = None
+        self._job = None
+        self._next_run = None
+        self._heap = []
+        self._queued = set()
+        self._loaded_until = None
+
+    def add(self, sanction_id, expires_at):
+        """Учесть новый срок (уже записанный в sanctions)"""
+        # Сроки за пределами окна подгрузятся из базы позже
+        if self._loaded_until is None or expires_at > self._loaded_until:
+            return
+        self._push(sanction_id, expires_at)
+        self._schedule(expires_at)
+
+    def _push(self, sanction_id, expires_at):
+        if sanction_id not in self._queued:
+            self._queued.add(sanction_id)
+            heapq.heappush(self._heap, (expires_at, sanction_id))
+
+    def _load(self, now):
+        horizon = now + LOAD_WINDOW
+        conn = Database.get_connection()
+        if conn is None:
+            # Без базы (режим заглушки) сроков нет - заглянем снова в конце окна
+            self._loaded_until = horizon
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT sanction_id, expires_at FROM sanctions
+                    WHERE expired_at IS NULL AND expires_at <= %s
+                    ORDER BY expires_at
+                    LIMIT %s
+                ''', (horizon, LOAD_LIMIT))
+                rows = cur.fetchall()
+        finally:
+            Database.return_connection(conn)
+
+        for sanction_id, expires_at in rows:
+            self._push(sanction_id, expires_at)
+        # Если уперлись в лимит, окно заканчивается на последнем загруженном сроке
+        self._loaded_until = rows[-1][1] if len(rows) == LOAD_LIMIT else horizon
+
+    def _schedule(self, when):
+        if self._job_queue is None:
+            return
+        if self._job and self._next_run <= when:
+            return
+        if self._job:
+            self._job.schedule_removal()
+
+        delay = max(0, (when - datetime.now()).total_seconds())
+        self._job = self._job_queue.run_once(self._run, delay)
+        self._next_run = when
+
+    async def _run(self, context: CallbackContext):
+        self._job = None
+        now = datetime.now()
+
+        if self._loaded_until is None or now >= self._loaded_until:
+            try:
+                self._load(now)
+            except Exception as e:
+                logger.error(f"Error loading sanctions: {e}")
+                self._schedule(now + timedelta(minutes=1))
+                return
+
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < BATCH_SIZE:
+            _, sanction_id = heapq.heappop(self._heap)
+            self._queued.discard(sanction_id)
+            due.append(sanction_id)
+
+        if due:
+            await self._expire(context.bot, due)
+
+        # Следующий запуск: ближайший срок или конец подгруженного окна
+        next_run = self._loaded_until
+        if self._heap:
+            next_run = min(next_run, self._heap[0][0])
+        self._schedule(next_run)
+
+    async def _expire(self, bot, sanction_ids):
+        """Снять наказания пачкой: сначала вызовы API, затем короткая транзакция"""
+        try:
+            sanctions = self._fetch_due(sanction_ids)
+        except Exception as e:
+            logger.error(f"Error loading due sanctions: {e}")
+            self._retry(sanction_ids)
+            return
+
+        expired = []
+        lifted_bans = []
+        retry = []
+        for sanction_id, chat_id, user_id, sanction_type, superseded in sanctions:
+            # Более позднее наказание того же типа еще действует - снимет его срок
+            if not superseded:
+                try:
+                    if sanction_type == 'ban':
+                        await bot.unban_chat_member(chat_id, user_id, only_if_banned=True)
+                    elif sanction_type == 'mute':
+                        await bot.restrict_chat_member(chat_id, user_id, ChatPermissions.all_permissions())
+                except (BadRequest, Forbidden) as e:
+                    # Пользователя нет в чате или бот лишился прав - повтор не поможет
+                    logger.warning(f"Could not lift {sanction_type} for user {user_id}: {e}")
+                except (RetryAfter, NetworkError) as e:
+                    logger.warning(f"Lifting {sanction_type} for user {user_id} postponed: {e}")
+                    retry.append(sanction_id)
+                    continue
+                if sanction_type == 'ban':
+                    lifted_bans.append(user_id)
+            expired.append(sanction_id)
+
+        if retry:
+            self._retry(retry)
+        if not expired:
+            return
+
+        # Если процесс упадет до commit, наказания снимутся повторно после рестарта - это безвредно
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cur:
+                placeholders = ', '.join(['%s'] * len(expired))
+                cur.execute(f'''
+                    UPDATE sanctions SET expired_at = CURRENT_TIMESTAMP
+                    WHERE sanction_id IN ({placeholders}) AND expired_at IS NULL
+                ''', expired)
+
+                if lifted_bans:
+                    placeholders = ', '.join(['%s'] * len(lifted_bans))
+                    cur.execute(f'''
+                        UPDATE users SET is_banned = FALSE
+                        WHERE user_id IN ({placeholders})
+                    ''', lifted_bans)
+            conn.commit()
+
+            logger.info(f"Expired {len(expired)} sanctions")
+        except Exception as e:
+            logger.error(f"Error expiring sanctions: {e}")
+            conn.rollback()
+            self._retry(expired)
+        finally:
+            Database.return_connection(conn)
+
+    def _fetch_due(self, sanction_ids):
+        """Неснятые наказания из пачки и признак, что их перекрывает более позднее"""
+        conn = Database.get_connection()
+        try:
+            with conn.cursor() as cur:
+                placeholders = ', '.join(['%s'] * len(sanction_ids))
+                cur.execute(f'''
+                    SELECT s.sanction_id, s.chat_id, s.user_id, s.sanction_type,
+                           EXISTS (
+                               SELECT 1 FROM sanctions later
+                               WHERE later.chat_id = s.chat_id
+                                 AND later.user_id = s.user_id
+                                 AND later.sanction_type = s.sanction_type
+                                 AND later.expired_at IS NULL
+                                 AND later.expires_at > s.expires_at
+                           )
+                    FROM sanctions s
+                    WHERE s.sanction_id IN ({placeholders}) AND s.expired_at IS NULL
+                ''', sanction_ids)
+                sanctions = cur.fetchall()
+            conn.commit()
+            return sanctions
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            Database.return_connection(conn)
+
+    def _retry(self, sanction_ids):
+        """Вернуть сроки в кучу, попробуем при следующем запуске"""
+        retry_at = datetime.now() + timedelta(minutes=1)
+        for sanction_id in sanction_ids:
+            self._push(sanction_id, retry_at)
+
+expiry_scheduler = ExpiryScheduler()
+
+# Сроки, созданные на других экземплярах, попадают в кучу лидера
+cluster.on('sanction', lambda payload: expiry_scheduler.add(
+    payload['sanction_id'], datetime.fromisoformat(payload['expires_at'])
+))
+
+def schedule_sanction(chat_id, user_id, sanction_type, duration_minutes, reason=None):
+    """Записать наказание со сроком ('ban', 'mute', 'warning') и поставить его в очередь"""
+    expires_at = datetime.now() + timedelta(minutes=duration_minutes)
+    sanction_id = Database.create_sanction(chat_id, user_id, sanction_type, expires_at, reason)
+    if sanction_id:
+        expiry_scheduler.add(sanction_id, expires_at)
+        cluster.publish('sanction', sanction_id=sanction_id, expires_at=expires_at.isoformat())
+    return sanction_id
@@ -1,6 +1,13 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram.error import Forbidden
+from datetime import datetime, timedelta
 from database import Database
+from archive import delete_message
+from expiry import schedule_sanction
+from chat_export import build_chat_export
+from admins import is_chat_admin
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,8 +17,7 @@ async def moderate_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     # Проверяем права администратора
-    chat_member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-    if chat_member.status not in ['creator', 'administrator']:
+    if not await is_chat_admin(context.bot, update.effective_chat.id, user.id):
         await update.message.reply_text("❌ Эта команда только для администраторов!")
         return
     
@@ -40,13 +46,13 @@ async def moderate_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ''')
             banned_users = cur.fetchone()[0]
             
-            # Последние жалобы
+            # Последние жалобы (по кластерам)
             cur.execute('''
-                SELECT r.report_id, u.username, r.reason, r.created_at
-                FROM reports r
-                JOIN users u ON r.reported_user_id = u.user_id
-                WHERE r.chat_id = %s AND r.status = 'pending'
-                ORDER BY r.created_at DESC
+                SELECT c.cluster_id, u.username, c.reason, c.report_count
+                FROM report_clusters c
+                JOIN users u ON c.reported_user_id = u.user_id
+                WHERE c.chat_id = %s AND c.status = 'pending'
+                ORDER BY c.updated_at DESC
                 LIMIT 5
             ''', (update.effective_chat.id,))
             
@@ -67,9 +73,8 @@ async def moderate_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📋 <b>Последние жалобы:</b>
 """
     
-    for report_id, username, reason, created_at in recent_reports:
-        time_ago = "только что"  # Здесь можно добавить расчет времени
-        panel_text += f"├ #{report_id}: @{username} - {reason} ({time_ago})\n"
+    for cluster_id, username, reason, report_count in recent_reports:
+        panel_text += f"├ #{cluster_id}: @{username} - {reason} (жалоб: {report_count})\n"
     
     if not recent_reports:
         panel_text += "└ Нет ожидающих жалоб\n"
@@ -116,6 +121,10 @@ async def handle_moderation_callback(update: Update, context: ContextTypes.DEFAU
         await show_active_votes(query, context)
     elif action == "ban_list":
         await show_ban_list(query, context)
+    elif action == "chat_stats":
+        await send_chat_export(query, context)
+    elif action == "cluster":
+        await handle_cluster_action(query, context, data[2], int(data[3]))
     elif action == "refresh":
         await query.delete_message()
         await moderate_panel(update, context)
@@ -123,27 +132,25 @@ async def handle_moderation_callback(update: Update, context: ContextTypes.DEFAU
         await query.delete_message()
 
 async def show_pending_reports(query, context):
-    """Показать ожидающие жалобы"""
+    """Показать ожидающие жалобы, сгруппированные по сообщению"""
     conn = Database.get_connection()
     try:
         with conn.cursor() as cur:
             cur.execute('''
-                SELECT r.report_id, r.reason, r.report_type, 
-                       u1.username as reporter, u2.username as reported,
-                       r.created_at, r.message_id
-                FROM reports r
-                JOIN users u1 ON r.reporter_id = u1.user_id
-                JOIN users u2 ON r.reported_user_id = u2.user_id
-                WHERE r.chat_id = %s AND r.status = 'pending'
-                ORDER BY r.created_at DESC
+                SELECT c.cluster_id, c.reason, c.report_type, c.report_count,
+                       u.username as reported, c.created_at, c.message_id
+                FROM report_clusters c
+                JOIN users u ON c.reported_user_id = u.user_id
+                WHERE c.chat_id = %s AND c.status = 'pending'
+                ORDER BY c.report_count DESC, c.updated_at DESC
                 LIMIT 10
             ''', (query.message.chat_id,))
             
-            reports = cur.fetchall()
+            clusters = cur.fetchall()
     finally:
         Database.return_connection(conn)
     
-    if not reports:
+    if not clusters:
         await query.edit_message_text(
             text="📭 Нет ожидающих жалоб",
             reply_markup=InlineKeyboardMarkup([[
@@ -155,19 +162,19 @@ async def show_pending_reports(query, context):
     text = "📨 <b>ОЖИДАЮЩИЕ ЖАЛОБЫ</b>\n\n"
     
     keyboard = []
-    for report in reports:
-        report_id, reason, report_type, reporter, reported, created_at, message_id = report
-        text += f"<b>#{report_id}</b> | {report_type.upper()}\n"
-        text += f"👤 От: @{reporter}\n"
+    for cluster in clusters:
+        cluster_id, reason, report_type, report_count, reported, created_at, message_id = cluster
+        text += f"<b>#{cluster_id}</b> | {report_type.upper()} | жалоб: {report_count}\n"
         text += f"👥 На: @{reported}\n"
         text += f"📝 Причина: {reason}\n"
         text += f"🕐 {created_at.strftime('%H:%M %d.%m')}\n"
         text += "─" * 30 + "\n"
         
         keyboard.append([
-            InlineKeyboardButton(f"👁️ #{report_id}", callback_data=f"mod:view_report:{report_id}"),
-            InlineKeyboardButton(f"⚖️ Голосовать", callback_data=f"mod:vote_on:{report_id}"),
-            InlineKeyboardButton(f"✅ Решить", callback_data=f"mod:resolve:{report_id}")
+            InlineKeyboardButton(f"👁️ #{cluster_id}", callback_data=f"view_message:{message_id}"),
+            InlineKeyboardButton("✅ Решить", callback_data=f"mod:cluster:resolve:{cluster_id}"),
+            InlineKeyboardButton("❌ Отклонить", callback_data=f"mod:cluster:dismiss:{cluster_id}"),
+            InlineKeyboardButton("⬆️ Мут", callback_data=f"mod:cluster:escalate:{cluster_id}")
         ])
     
     keyboard.append([InlineKeyboardButton("↩️ Назад", callback_data="mod:refresh")])
@@ -178,6 +185,95 @@ async def show_pending_reports(query, context):
         parse_mode='HTML'
     )
 
+# Действие над кластером -> итоговый статус жалоб
+CLUSTER_STATUSES = {
+    'resolve': 'resolved',
+    'dismiss': 'dismissed',
+    'escalate': 'escalated'
+}
+
+# Мут при эскалации (минуты)
+ESCALATION_MUTE_MINUTES = 60
+
+async def handle_cluster_action(query, context, action, cluster_id):
+    """Решить, отклонить или эскалировать все жалобы кластера разом"""
+    chat_id = query.message.chat_id
+    
+    # query.answer() уже вызван в handle_moderation_callback
+    if not await is_chat_admin(context.bot, chat_id, query.from_user.id):
+        return
+    
+    status = CLUSTER_STATUSES.get(action)
+    if not status:
+        return
+    
+    result = Database.close_report_cluster(cluster_id, chat_id, status, query.from_user.id)
+    if not result:
+        # Кластер уже закрыт другим администратором - просто обновим список
+        await show_pending_reports(query, context)
+        return
+    
+    message_id, reported_user_id, report_count = result
+    
+    # Решение и эскалация убирают сообщение-нарушение
+    if action in ('resolve', 'escalate') and message_id:
+        await delete_message(context.bot, chat_id, message_id, reason='report', deleted_by=query.from_user.id)
+    
+    if action == 'escalate':
+        try:
+            await context.bot.restrict_chat_member(
+                chat_id,
+                reported_user_id,
+                ChatPermissions.no_permissions(),
+                until_date=datetime.now() + timedelta(minutes=ESCALATION_MUTE_MINUTES)
+            )
+            schedule_sanction(chat_id, reported_user_id, 'mute', ESCALATION_MUTE_MINUTES, "Жалобы участников")
+        except Exception as e:
+            logger.error(f"Error muting user: {e}")
+    
+    logger.info(f"Report cluster {cluster_id} {status}: {report_count} reports")
+    await show_pending_reports(query, context)
+
+async def send_chat_export(query, context):
+    """Выгрузить статистику чата архивом"""
+    chat_id = query.message.chat_id
+    
+    if not await is_chat_admin(context.bot, chat_id, query.from_user.id):
+        return
+    
+    status_message = await query.message.reply_text("⏳ Готовлю выгрузку статистики чата...")
+    
+    # Выгрузка читает базу порциями и не должна блокировать цикл событий
+    try:
+        export_file = await asyncio.to_thread(build_chat_export, chat_id)
+    except Exception as e:
+        logger.error(f"Error exporting chat stats: {e}")
+        await status_message.edit_text("❌ Ошибка при выгрузке статистики")
+        return
+    
+    # В выгрузке видно, кто на кого жаловался - отправляем только запросившему админу
+    try:
+        await context.bot.send_document(
+            chat_id=query.from_user.id,
+            document=export_file,
+            filename=f"chat_{chat_id}_stats_{datetime.now():%Y%m%d}.zip",
+            caption="📊 Статистика чата: активность по часам, топ участников, реакции, жалобы и голосования"
+        )
+    except Forbidden:
+        await status_message.edit_text(
+            "❌ Не могу написать вам в личные сообщения. Откройте чат с ботом, нажмите /start и повторите"
+        )
+        return
+    except Exception as e:
+        # Например, архив больше лимита загрузки для ботов (50 МБ)
+        logger.error(f"Error sending chat stats export: {e}")
+        await status_message.edit_text("❌ Не удалось отправить выгрузку статистики")
+        return
+    finally:
+        export_file.close()
+    
+    await status_message.edit_text("📬 Выгрузка отправлена вам в личные сообщения")
+
 # Добавляем обработчики в основное приложение
 def add_moderation_handlers(application):
     """Добавить обработчики модерации"""
@@ -0,0 +1,313 @@
+from datetime import datetime
+from functools import lru_cache
+import sqlite3
+import threading
+
+# Настройки SQLite для одного процесса бота: WAL позволяет читать во время записи
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -20000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA busy_timeout = 5000',
+]
+
+# Сколько подготовленных запросов держать на каждом соединении
+STATEMENT_CACHE_SIZE = 256
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _translate(sql):
+    """Запросы пишутся в стиле psycopg2 (%s), SQLite ждет ?"""
+    return sql.replace('%s', '?')
+
+class _Cursor:
+    """Курсор SQLite с тем же интерфейсом, что и у psycopg2"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.itersize = None  # для совместимости с серверными курсорами Postgres
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(_translate(sql), params)
+
+    def executemany(self, sql, params):
+        self._cursor.executemany(_translate(sql), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+class _Connection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name=None):
+        # name - имя серверного курсора в Postgres; SQLite и так читает построчно
+        return _Cursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+class SQLiteBackend:
+    """Встроенная база в одном файле: без сетевых запросов, для небольших чатов и тестов"""
+
+    name = 'sqlite'
+    SCHEMA = [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            username_lower TEXT GENERATED ALWAYS AS (LOWER(username)) VIRTUAL,
+            rating INTEGER NOT NULL DEFAULT 0,
+            positive_reactions INTEGER NOT NULL DEFAULT 0,
+            negative_reactions INTEGER NOT NULL DEFAULT 0,
+            neutral_reactions INTEGER NOT NULL DEFAULT 0,
+            warnings INTEGER NOT NULL DEFAULT 0,
+            is_banned BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (username_lower)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            joined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER,
+            message_type TEXT,
+            content TEXT,
+            photo_url TEXT,
+            file_id TEXT,
+            caption TEXT,
+            media_unique_id TEXT,
+            is_deleted BOOLEAN NOT NULL DEFAULT FALSE,
+            deleted_at TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (message_id, chat_id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_messages_media
+            ON messages (media_unique_id) WHERE media_unique_id IS NOT NULL
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS message_reactions (
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            reaction TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (message_id, chat_id, user_id, reaction)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reaction_stats (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            reaction TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id, reaction)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reaction_stats_top
+            ON reaction_stats (chat_id, user_id, count DESC)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reports (
+            report_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reporter_id INTEGER NOT NULL,
+            reported_user_id INTEGER NOT NULL,
+            message_id INTEGER,
+            chat_id INTEGER NOT NULL,
+            reason TEXT,
+            report_type TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            cluster_id INTEGER,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reports_cluster ON reports (cluster_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reports_reported ON reports (reported_user_id, chat_id)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS report_clusters (
+            cluster_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER,
+            reported_user_id INTEGER NOT NULL,
+            report_type TEXT,
+            reason TEXT,
+            report_count INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            resolved_by INTEGER,
+            resolved_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_report_clusters_pending
+            ON report_clusters (chat_id, message_id, reported_user_id) WHERE status = 'pending'
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS votes (
+            vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            target_user_id INTEGER NOT NULL,
+            initiator_user_id INTEGER NOT NULL,
+            vote_type TEXT NOT NULL,
+            duration_minutes INTEGER,
+            reason TEXT,
+            related_message_id INTEGER,
+            required_votes INTEGER NOT NULL DEFAULT 3,
+            votes_for INTEGER NOT NULL DEFAULT 0,
+            votes_against INTEGER NOT NULL DEFAULT 0,
+            voters TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            vote_message_id INTEGER,
+            ends_at TIMESTAMP,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS message_versions (
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            content TEXT,
+            caption TEXT,
+            edited_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id, version)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS message_tombstones (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            deleted_by INTEGER,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            file_size INTEGER,
+            mime_type TEXT,
+            file_name TEXT,
+            post_count INTEGER NOT NULL DEFAULT 1,
+            first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sanctions (
+            sanction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            sanction_type TEXT NOT NULL,
+            reason TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            expired_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sanctions_pending
+            ON sanctions (expires_at) WHERE expired_at IS NULL
+        ''',
+    ]
+
+    # Колонки, появившиеся после первой версии схемы: (таблица, колонка, тип).
+    # В SQLite нет ADD COLUMN IF NOT EXISTS, поэтому проверяем PRAGMA table_info
+    COLUMNS = [
+        ('votes', 'vote_message_id', 'INTEGER'),
+        ('votes', 'ends_at', 'TIMESTAMP'),
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        # У каждого потока свое соединение (запросы из asyncio.to_thread)
+        self._local = threading.local()
+
+    def get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            raw = sqlite3.connect(
+                self.path,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False
+            )
+            for pragma in PRAGMAS:
+                raw.execute(pragma)
+            conn = self._local.conn = _Connection(raw)
+        return conn
+
+    def return_connection(self, conn):
+        # Соединение остается привязанным к потоку; как и putconn в пуле psycopg2,
+        # откатываем незавершенную транзакцию, чтобы ее не закоммитил чужой commit()
+        if conn is not None and conn._conn.in_transaction:
+            conn.rollback()
+
+    def migrate(self, cur):
+        """Добавить недостающие колонки в базы, созданные старой версией схемы"""
+        for table, column, column_type in self.COLUMNS:
+            cur.execute(f'PRAGMA table_info({table})')
+            if column not in {row[1] for row in cur.fetchall()}:
+                cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def record_tombstones(self, cur, rows):
+        """Записать удаления пачкой: rows = [(chat_id, message_id, reason, deleted_by, deleted_at)]"""
+        cur.executemany('''
+            INSERT INTO message_tombstones
+            (chat_id, message_id, reason, deleted_by, deleted_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (chat_id, message_id) DO NOTHING
+        ''', rows)
+
+        cur.executemany('''
+            UPDATE messages
+            SET is_deleted = TRUE,
+                deleted_at = %s
+            WHERE chat_id = %s AND message_id = %s
+        ''', [(deleted_at, chat_id, message_id) for chat_id, message_id, _, _, deleted_at in rows])
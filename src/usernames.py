@@ -0,0 +1,82 @@
+from telegram import User
+from cache import LRUCache
+from database import Database
+from cluster import cluster
+import asyncio
+
+class UsernameIndex:
+    """Индекс username -> user_id по чатам, без учета регистра"""
+
+    def __init__(self, max_chats=1000, max_users_per_chat=5000, max_profiles=50000):
+        self.max_users_per_chat = max_users_per_chat
+        # chat_id -> LRUCache(username в нижнем регистре -> user_id)
+        self._chats = LRUCache(maxsize=max_chats)
+        # user_id -> (username, first_name), последние известные данные профиля
+        self._profiles = LRUCache(maxsize=max_profiles)
+
+    def observe(self, chat_id, user: User):
+        """Учесть автора сообщения; True, если профиль новый или изменился"""
+        changed = self._profiles.get(user.id) != (user.username, user.first_name)
+        self.add(chat_id, user.id, user.username, user.first_name)
+        return changed
+
+    def add(self, chat_id, user_id, username, first_name):
+        self._profiles.set(user_id, (username, first_name))
+        if not username:
+            return
+
+        chat_index = self._chats.get(chat_id)
+        if chat_index is None:
+            chat_index = LRUCache(maxsize=self.max_users_per_chat)
+            self._chats.set(chat_id, chat_index)
+        chat_index.set(username.lower(), user_id)
+
+    def resolve(self, chat_id, username):
+        """(user_id, first_name) по username или None"""
+        chat_index = self._chats.get(chat_id)
+        if chat_index is None:
+            return None
+
+        key = username.lower()
+        user_id = chat_index.get(key)
+        if user_id is None:
+            return None
+
+        # Пользователь мог сменить username - старую запись выбрасываем
+        profile = self._profiles.get(user_id)
+        if profile is None or (profile[0] or '').lower() != key:
+            chat_index.pop(key)
+            return None
+        return user_id, profile[1]
+
+    def update_profile(self, user_id, username, first_name):
+        """Обновить профиль (записи со старым username отпадут при следующем поиске)"""
+        self._profiles.set(user_id, (username, first_name))
+
+username_index = UsernameIndex()
+
+# Профиль изменился на другом экземпляре - старые данные здесь больше не верны
+cluster.on('user', lambda payload: username_index.update_profile(
+    payload['user_id'], payload['username'], payload['first_name']
+))
+
+def observe_user(chat_id, user: User):
+    """Обновить индекс по автору сообщения, в базу пишем только изменения профиля"""
+    if user and username_index.observe(chat_id, user):
+        Database.upsert_user(user.id, user.username, user.first_name)
+        cluster.publish('user', user_id=user.id, username=user.username, first_name=user.first_name)
+
+async def resolve_username(chat_id, username):
+    """Найти (user_id, first_name) по username: сначала индекс, потом база"""
+    username = username.lstrip('@')
+    result = username_index.resolve(chat_id, username)
+    if result:
+        return result
+
+    # Запрос к базе не блокирует цикл событий
+    result = await asyncio.to_thread(Database.find_user_by_username, username)
+    if result:
+        user_id, found_username, first_name = result
+        username_index.add(chat_id, user_id, found_username, first_name)
+        return user_id, first_name
+    return None
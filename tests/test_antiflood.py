@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from antiflood import (
+    DUPLICATE_MIN_SIMILARITY, DUPLICATE_THRESHOLD, FLOOD_MAX_MESSAGES, FloodDetector, signature, similarity
+)
+
+SPAM = ("Заходите в наш канал там лучшие сигналы по крипте бесплатно "
+        "только сегодня пишите в личку за подробностями ссылка в профиле")
+
+def test_one_word_changed_is_duplicate():
+    original = signature(SPAM)
+    words = SPAM.split()
+    for i in range(len(words)):
+        variant = words[:i] + ['привет'] + words[i + 1:]
+        assert similarity(original, signature(' '.join(variant))) >= DUPLICATE_MIN_SIMILARITY
+
+def test_appended_counter_is_duplicate():
+    original = signature(SPAM)
+    for counter in range(20):
+        assert similarity(original, signature(f"{SPAM} {counter}")) >= DUPLICATE_MIN_SIMILARITY
+
+def test_unrelated_messages_are_not_duplicates():
+    messages = [
+        SPAM,
+        "Привет всем, кто идет сегодня вечером на встречу в парке у фонтана?",
+        "Я думаю, что этот фильм был намного лучше книги, особенно финал",
+        "Подскажите, пожалуйста, как настроить роутер, чтобы интернет не пропадал ночью",
+    ]
+    signatures = [signature(text) for text in messages]
+    for i in range(len(signatures)):
+        for j in range(i + 1, len(signatures)):
+            assert similarity(signatures[i], signatures[j]) < DUPLICATE_MIN_SIMILARITY
+
+def test_detector_flags_varied_spam():
+    detector = FloodDetector()
+    verdicts = [
+        detector.check(1, 2, f"{SPAM} {counter}", now=counter * 5.0)
+        for counter in range(DUPLICATE_THRESHOLD)
+    ]
+    assert verdicts[:-1] == [None] * (DUPLICATE_THRESHOLD - 1)
+    assert verdicts[-1] == 'duplicate'
+
+def test_album_counts_as_one_message():
+    detector = FloodDetector()
+    verdicts = [detector.check(1, 2, now=i * 0.05, media_group_id='album') for i in range(10)]
+    assert verdicts == [None] * 10
+
+def test_flood_trips_on_eighth_message():
+    detector = FloodDetector()
+    verdicts = [detector.check(1, 2, now=i * 0.05) for i in range(FLOOD_MAX_MESSAGES + 1)]
+    assert verdicts[:FLOOD_MAX_MESSAGES - 1] == [None] * (FLOOD_MAX_MESSAGES - 1)
+    assert verdicts[FLOOD_MAX_MESSAGES - 1:] == ['flood', 'throttled']
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+from database import Database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE_BACKEND', 'sqlite')
+    monkeypatch.setattr(Config, 'SQLITE_PATH', str(tmp_path / 'bot.db'))
+    Database.initialize()
+    Database.create_tables()
+    return Database
+
+def _query(db, sql, params=()):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+    finally:
+        db.return_connection(conn)
+
+def test_reports_on_same_message_share_a_cluster(db):
+    first = db.create_report(1, 42, 100, -5, "Спам")
+    second = db.create_report(2, 42, 100, -5, "Спам")
+    other = db.create_report(3, 42, 101, -5, "Оскорбление")
+    assert None not in (first, second, other)
+
+    clusters = _query(db, 'SELECT cluster_id, message_id, report_count FROM report_clusters ORDER BY cluster_id')
+    assert [(row[1], row[2]) for row in clusters] == [(100, 2), (101, 1)]
+
+    cluster_id = clusters[0][0]
+    assert db.close_report_cluster(cluster_id, -5, 'resolved', 7) == (100, 42, 2)
+    assert db.close_report_cluster(cluster_id, -5, 'resolved', 7) is None
+    assert _query(db, 'SELECT DISTINCT status FROM reports WHERE cluster_id = %s', (cluster_id,)) == [('resolved',)]
+
+    # После закрытия новая жалоба открывает новый кластер
+    db.create_report(4, 42, 100, -5, "Спам")
+    assert _query(db, "SELECT COUNT(*) FROM report_clusters WHERE status = 'pending'") == [(2,)]
+
+def test_active_votes_with_timer(db):
+    ends_at = datetime.now() + timedelta(minutes=5)
+    vote_id = db.create_vote(-5, 42, 1, 'ban', 60, "Спам", 100)
+    untimed_id = db.create_vote(-5, 43, 1, 'ban', 60, "Спам", 101)
+    db.set_vote_message(vote_id, 555, ends_at)
+
+    assert db.get_active_votes() == [(vote_id, -5, 555, 42, 60, ends_at)]
+    assert db.get_active_votes(vote_id) == [(vote_id, -5, 555, 42, 60, ends_at)]
+    assert db.get_active_votes(untimed_id) == []
+
+def test_record_tombstones_marks_messages_deleted(db):
+    message = SimpleNamespace(
+        message_id=100, chat=SimpleNamespace(id=-5), from_user=SimpleNamespace(id=42),
+        text="Привет", caption=None
+    )
+    db.save_message_content(message)
+
+    deleted_at = datetime(2024, 1, 1, 12, 0)
+    rows = [(-5, 100, 'admin', 7, deleted_at), (-5, 101, 'spam', None, deleted_at)]
+    db.record_tombstones(rows)
+    db.record_tombstones(rows)
+
+    assert _query(db, 'SELECT COUNT(*) FROM message_tombstones') == [(2,)]
+    assert _query(db, 'SELECT is_deleted, deleted_at FROM messages WHERE message_id = 100') == [(1, deleted_at)]
+
+def test_old_database_gets_vote_columns(tmp_path, monkeypatch):
+    path = tmp_path / 'old.db'
+    raw = sqlite3.connect(path)
+    raw.execute('''
+        CREATE TABLE votes (
+            vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            target_user_id INTEGER NOT NULL,
+            initiator_user_id INTEGER NOT NULL,
+            vote_type TEXT NOT NULL,
+            duration_minutes INTEGER,
+            reason TEXT,
+            related_message_id INTEGER,
+            required_votes INTEGER NOT NULL DEFAULT 3,
+            votes_for INTEGER NOT NULL DEFAULT 0,
+            votes_against INTEGER NOT NULL DEFAULT 0,
+            voters TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    raw.commit()
+    raw.close()
+
+    monkeypatch.setattr(Config, 'DATABASE_BACKEND', 'sqlite')
+    monkeypatch.setattr(Config, 'SQLITE_PATH', str(path))
+    Database.initialize()
+    Database.create_tables()
+    Database.create_tables()
+
+    vote_id = Database.create_vote(-5, 42, 1, 'ban', 60, None, None)
+    ends_at = datetime.now() + timedelta(minutes=5)
+    Database.set_vote_message(vote_id, 555, ends_at)
+    assert Database.get_active_votes() == [(vote_id, -5, 555, 42, 60, ends_at)]